@@ -1,14 +1,21 @@
+import asyncio
+import calendar
 import os
 import logging
-from datetime import datetime, timedelta
-from typing import List
-
-import requests
+import time
+from typing import Final, List, NamedTuple, Optional
+
+import httpx
+import ijson
+import numpy as np
+import orjson
+import redis.asyncio as aioredis
 from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # ---------- CORS so the website can call this API ----------
 origins = [
@@ -26,6 +33,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---------- Shared async HTTP client (created at startup) ----------
+# One client for the whole app so outbound calls never block the event loop
+# and TCP connections to The Odds API get reused.
+http_client: Optional[httpx.AsyncClient] = None
+
+
+@app.on_event("startup")
+async def open_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=10,
+        # keep-alive pool sized for one upstream host, so repeat calls to
+        # The Odds API skip the TCP+TLS handshake
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=4),
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    if http_client is not None:
+        await http_client.aclose()
+
+
+# ---------- Odds cache ----------
+# Odds for a (sport, h2h) pair only move every few minutes and are the same
+# for every user, so cache the raw API payload for a short TTL. Uses Redis
+# when REDIS_URL is set; otherwise falls back to a small in-process dict.
+REDIS_URL = os.environ.get("REDIS_URL")
+ODDS_CACHE_TTL = 60  # seconds
+
+redis_client: Optional[aioredis.Redis] = None
+
+_local_cache: dict[str, tuple[float, bytes]] = {}
+_local_cache_lock = asyncio.Lock()
+
+
+@app.on_event("startup")
+async def open_redis_client():
+    global redis_client
+    if REDIS_URL:
+        redis_client = aioredis.from_url(REDIS_URL)
+
+
+@app.on_event("shutdown")
+async def close_redis_client():
+    if redis_client is not None:
+        await redis_client.aclose()
+
+
+async def _cache_get(key: str) -> Optional[bytes]:
+    if redis_client is not None:
+        try:
+            return await redis_client.get(key)
+        except Exception as e:
+            logging.warning("Redis GET failed, skipping cache: %s", e)
+            return None
+
+    async with _local_cache_lock:
+        entry = _local_cache.get(key)
+        if entry and time.monotonic() < entry[0]:
+            return entry[1]
+        _local_cache.pop(key, None)
+        return None
+
+
+async def _cache_set(key: str, value: bytes, ttl: int) -> None:
+    if redis_client is not None:
+        try:
+            await redis_client.setex(key, ttl, value)
+        except Exception as e:
+            logging.warning("Redis SETEX failed, skipping cache: %s", e)
+        return
+
+    async with _local_cache_lock:
+        _local_cache[key] = (time.monotonic() + ttl, value)
+
 # ---------- Root endpoint ----------
 @app.get("/")
 def read_root():
@@ -33,18 +117,26 @@ def read_root():
 
 
 # ---------- Models ----------
+# Frozen + extra="forbid" so pydantic_core generates strict, immutable
+# validators once at import; these are the only definitions in the app.
 class ParlayLeg(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     team: str
     pick: str  # e.g. "ML", "Spread", etc.
 
 
 class ParlayRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     sport: str
     legs: List[ParlayLeg]
     style: str = "normal"  # "safe", "normal", "spicy"
 
 
 class ParlayResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     sport: str
     legs: List[ParlayLeg]
     style: str
@@ -55,7 +147,7 @@ class ParlayResponse(BaseModel):
 # ---------- Odds API config ----------
 ODDS_API_KEY = os.environ.get("ODDS_API_KEY")
 
-SPORT_KEYS = {
+SPORT_KEYS: Final[dict[str, str]] = {
     "nfl": "americanfootball_nfl",
     "nba": "basketball_nba",
     "mlb": "baseball_mlb",
@@ -63,17 +155,76 @@ SPORT_KEYS = {
     "cfb": "americanfootball_ncaaf",
 }
 
+# Query-string validators, built once at import instead of per call site.
+_SPORT_PATTERN: Final[str] = "^(nfl|nba|mlb|nhl|cfb)$"
+_STYLE_PATTERN: Final[str] = "^(safe|normal|spicy)$"
+
+# Confidence by number of legs, frozen at module level so the response
+# helper doesn't rebuild the dict on every request.
+_CONFIDENCE_MAP: Final[dict[int, str]] = {
+    1: "92%",
+    2: "88%",
+    3: "82%",
+    4: "76%",
+    5: "70%",
+}
 
-def fetch_moneyline_candidates(sport: str, days: int = 3) -> list[dict]:
-    """
-    Pulls moneyline odds from The Odds API and returns a flat list of
-    {team, price, event} candidate legs.
-    """
-    if not ODDS_API_KEY:
-        logging.error("ODDS_API_KEY is not set")
-        return []
 
-    api_sport_key = SPORT_KEYS.get(sport, sport)
+# In-flight fetches keyed by sport, so N concurrent cache misses for the
+# same sport share one upstream call instead of firing N identical ones.
+_inflight: dict[str, asyncio.Future] = {}
+
+
+class _AsyncByteReader:
+    """Minimal async file-like wrapper so ijson can pull from an httpx stream."""
+
+    def __init__(self, resp: httpx.Response):
+        self._chunks = resp.aiter_bytes()
+
+    async def read(self, n: int = -1) -> bytes:
+        if n == 0:
+            # ijson probes with read(0) to sniff string vs bytes input
+            return b""
+        async for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+
+def _slim_event(event: dict) -> Optional[dict]:
+    """Keep only the fields the candidate builder reads: the commence time,
+    the matchup teams, and the first bookmaker's h2h outcomes."""
+    bookmakers = event.get("bookmakers") or []
+    if not bookmakers:
+        return None
+
+    # Take first bookmaker for simplicity
+    markets = bookmakers[0].get("markets") or []
+    market = next((m for m in markets if m.get("key") == "h2h"), None)
+    if not market:
+        return None
+
+    return {
+        "commence_time": event.get("commence_time"),
+        "away_team": event.get("away_team"),
+        "home_team": event.get("home_team"),
+        "outcomes": market.get("outcomes") or [],
+    }
+
+
+# Last seen ETag and parsed events per sport, for conditional GETs: when the
+# upstream data hasn't changed we get a bodyless 304 and reuse the parse.
+_etag: dict[str, str] = {}
+_last_events: dict[str, list] = {}
+
+
+async def _fetch_odds_payload(api_sport_key: str) -> Optional[list]:
+    """One HTTP round-trip to The Odds API; None on any failure.
+
+    The payload is stream-parsed one event at a time (ijson) and slimmed
+    immediately, so the full multi-hundred-KB slate is never buffered and
+    the cache only holds the fields we actually use.
+    """
     url = f"https://api.the-odds-api.com/v4/sports/{api_sport_key}/odds"
 
     params = {
@@ -84,100 +235,215 @@ def fetch_moneyline_candidates(sport: str, days: int = 3) -> list[dict]:
         "dateFormat": "iso",
     }
 
+    headers = {}
+    if api_sport_key in _etag and api_sport_key in _last_events:
+        headers["If-None-Match"] = _etag[api_sport_key]
+
     try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+        async with http_client.stream("GET", url, params=params, headers=headers) as resp:
+            if resp.status_code == 304:
+                return _last_events[api_sport_key]
+            resp.raise_for_status()
+            events = []
+            async for event in ijson.items(_AsyncByteReader(resp), "item", use_float=True):
+                slim = _slim_event(event)
+                if slim is not None:
+                    events.append(slim)
+
+            new_etag = resp.headers.get("ETag")
+            if new_etag:
+                _etag[api_sport_key] = new_etag
+                _last_events[api_sport_key] = events
+            return events
     except Exception as e:
         logging.exception("Error talking to The Odds API: %s", e)
-        return []
+        return None
+
+
+def implied_probs(prices: np.ndarray) -> np.ndarray:
+    """Decimal odds -> implied win probability (1/price), vectorized."""
+    return 1.0 / prices
+
+
+def parlay_hit_prob(probs: np.ndarray) -> float:
+    """Probability of every leg hitting (product of leg probabilities)."""
+    return float(np.prod(probs))
+
+
+class MoneylineCandidates(NamedTuple):
+    """Candidate legs stored as parallel arrays (struct-of-arrays) so the
+    numeric columns stay contiguous and sortable in C rather than per-row
+    Python dicts."""
+
+    teams: np.ndarray    # team names, object dtype
+    matchups: np.ndarray  # "away @ home" strings, object dtype
+    prices: np.ndarray   # decimal odds, float64
+    probs: np.ndarray    # implied win probability, float64
+
+    def __len__(self) -> int:
+        return len(self.teams)
+
 
-    # Optionally filter by start time (next N days)
-    now = datetime.utcnow()
-    cutoff = now + timedelta(days=days)
-    candidates: list[dict] = []
+_NO_CANDIDATES = MoneylineCandidates(
+    np.empty(0, dtype=object), np.empty(0, dtype=object), np.empty(0), np.empty(0)
+)
+
+
+def _iso_z_to_epoch(ts: str) -> int:
+    """Epoch seconds for an Odds API timestamp (fixed 'YYYY-MM-DDTHH:MM:SSZ').
+
+    Slicing the fixed-width fields skips the general-purpose ISO parser and
+    the tz-aware datetime objects entirely; comparisons stay plain ints.
+    """
+    return calendar.timegm(
+        (
+            int(ts[0:4]),
+            int(ts[5:7]),
+            int(ts[8:10]),
+            int(ts[11:13]),
+            int(ts[14:16]),
+            int(ts[17:19]),
+            0,
+            0,
+            0,
+        )
+    )
+
+
+async def fetch_moneyline_candidates(sport: str, days: int = 3) -> MoneylineCandidates:
+    """
+    Pulls moneyline odds from The Odds API and returns candidate legs as
+    parallel teams/matchups/prices/probs arrays.
+    """
+    if not ODDS_API_KEY:
+        logging.error("ODDS_API_KEY is not set")
+        return _NO_CANDIDATES
+
+    if http_client is None:
+        logging.error("HTTP client not ready (startup hasn't run)")
+        return _NO_CANDIDATES
+
+    api_sport_key = SPORT_KEYS.get(sport, sport)
+
+    cache_key = f"odds:{api_sport_key}"
+    cached = await _cache_get(cache_key)
+    if cached is not None:
+        data = orjson.loads(cached)
+    elif cache_key in _inflight:
+        # Someone else is already fetching this sport; wait for their result.
+        data = await _inflight[cache_key]
+    else:
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        _inflight[cache_key] = fut
+        data = None
+        try:
+            data = await _fetch_odds_payload(api_sport_key)
+            if data is not None:
+                await _cache_set(cache_key, orjson.dumps(data), ODDS_CACHE_TTL)
+        finally:
+            fut.set_result(data)
+            del _inflight[cache_key]
+
+    if data is None:
+        return _NO_CANDIDATES
+
+    # Optionally filter by start time (next N days), comparing epoch seconds
+    now_ts = int(time.time())
+    cutoff_ts = now_ts + days * 86400
+    teams: List[str] = []
+    matchups: List[str] = []
+    raw_prices: List[object] = []
 
     for event in data:
         # Filter by time so you don't get way-future games
         try:
-            commence = datetime.fromisoformat(
-                event["commence_time"].replace("Z", "+00:00")
-            )
-            if not (now <= commence <= cutoff):
-                continue
-        except Exception:
+            commence_ts = _iso_z_to_epoch(event["commence_time"])
+        except (KeyError, TypeError, ValueError):
             pass  # if parsing fails, just include it
+        else:
+            if not (now_ts <= commence_ts <= cutoff_ts):
+                continue
 
-        bookmakers = event.get("bookmakers") or []
-        if not bookmakers:
-            continue
-
-        # Take first bookmaker for simplicity
-        markets = bookmakers[0].get("markets") or []
-        market = next((m for m in markets if m.get("key") == "h2h"), None)
-        if not market:
-            continue
+        matchup = f"{event.get('away_team', '?')} @ {event.get('home_team', '?')}"
 
-        outcomes = market.get("outcomes") or []
-        for o in outcomes:
+        for o in event.get("outcomes") or []:
             name = o.get("name")
             price = o.get("price")
             if name is None or price is None:
                 continue
-            candidates.append(
-                {
-                    "team": name,
-                    "price": float(price),
-                    "event": event,
-                }
-            )
+            teams.append(name)
+            matchups.append(matchup)
+            raw_prices.append(price)
+
+    # One C-level cast for the whole column instead of float() per outcome;
+    # anything non-numeric becomes NaN and is dropped by a single mask.
+    prices = np.fromiter(
+        (p if isinstance(p, (int, float)) else np.nan for p in raw_prices),
+        dtype=np.float64,
+        count=len(raw_prices),
+    )
+    teams_arr = np.asarray(teams, dtype=object)
+    matchups_arr = np.asarray(matchups, dtype=object)
+
+    valid = np.isfinite(prices)
+    if not valid.all():
+        teams_arr = teams_arr[valid]
+        matchups_arr = matchups_arr[valid]
+        prices = prices[valid]
+
+    return MoneylineCandidates(teams_arr, matchups_arr, prices, implied_probs(prices))
+
+
+def _smallest_k(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest values, in ascending order.
 
-    return candidates
+    argpartition selects the k entries in O(n); only those k get sorted,
+    instead of sorting the whole array to read a handful of elements.
+    """
+    k = min(k, len(values))
+    if k < len(values):
+        idx = np.argpartition(values, k - 1)[:k]
+    else:
+        idx = np.arange(len(values))
+    return idx[np.argsort(values[idx])]
 
 
-def generate_real_parlay(sport: str, style: str, legs: int) -> List[ParlayLeg]:
+async def generate_real_parlay(sport: str, style: str, legs: int) -> List[ParlayLeg]:
     """
     Turn live odds into a parlay list:
       - safe  = more favorites (shorter odds)
       - normal = middle-of-the-pack
       - spicy = more underdogs (longer odds)
     """
-    candidates = fetch_moneyline_candidates(sport)
+    candidates = await fetch_moneyline_candidates(sport)
 
-    if not candidates:
+    if not len(candidates):
         # Fallback to fake legs if odds fail
         return [ParlayLeg(team=f"Leg{i+1}", pick="ML") for i in range(legs)]
 
-    # Sort by decimal price: smaller = stronger favorite
-    candidates_sorted = sorted(candidates, key=lambda c: c["price"])
+    # Higher implied probability = stronger favorite, the same ordering as
+    # ascending decimal price. Only the top few indices are ever needed, so
+    # partial selection beats a full sort.
+    probs = candidates.probs
+    n = len(candidates)
 
     if style == "safe":
-        pool = candidates_sorted
+        chosen = _smallest_k(-probs, legs)
     elif style == "spicy":
-        pool = list(reversed(candidates_sorted))
+        chosen = _smallest_k(probs, legs)
     else:  # "normal"
-        # trim the extreme ends and use the middle chunk
-        n = len(candidates_sorted)
-        start = max(0, n // 4)
-        pool = candidates_sorted[start:]
-
-    chosen = pool[:legs]
+        # skip the strongest quarter of favorites, then take the next legs
+        head = _smallest_k(-probs, n // 4 + legs)
+        chosen = head[n // 4:]
 
-    return [ParlayLeg(team=c["team"], pick="ML") for c in chosen]
+    picked = candidates.teams[chosen[:legs]]
+    return [ParlayLeg(team=team, pick="ML") for team in picked]
 
 
 # ---------- Helper to compute confidence + note ----------
 def build_parlay_response(req: ParlayRequest, using_real_odds: bool) -> ParlayResponse:
     num_legs = len(req.legs)
-
-    confidence_map = {
-        1: "92%",
-        2: "88%",
-        3: "82%",
-        4: "76%",
-        5: "70%",
-    }
-    confidence = confidence_map.get(num_legs, "65%")
+    confidence = _CONFIDENCE_MAP.get(num_legs, "65%")
 
     if using_real_odds:
         note = (
@@ -187,7 +453,9 @@ def build_parlay_response(req: ParlayRequest, using_real_odds: bool) -> ParlayRe
     else:
         note = f"Test-only parlay: {num_legs} legs for {req.sport.upper()}. No real odds used."
 
-    return ParlayResponse(
+    # model_construct: every field here is server-built (req was already
+    # validated on the way in), so a second validation pass buys nothing.
+    return ParlayResponse.model_construct(
         sport=req.sport,
         legs=req.legs,
         style=req.style,
@@ -207,12 +475,14 @@ async def parlay_post(req: ParlayRequest):
 # This is what Wix is calling.
 @app.get("/parlay", response_model=ParlayResponse)
 async def parlay_get(
-    sport: str = Query("nfl", regex="^(nfl|nba|mlb|nhl|cfb)$"),
-    style: str = Query("normal", regex="^(safe|normal|spicy)$"),
+    sport: str = Query("nfl", pattern=_SPORT_PATTERN),
+    style: str = Query("normal", pattern=_STYLE_PATTERN),
     legs: int = Query(3, ge=1, le=10),
 ):
     # Build legs from REAL odds
-    real_legs = generate_real_parlay(sport=sport, style=style, legs=legs)
+    real_legs = await generate_real_parlay(sport=sport, style=style, legs=legs)
 
-    req = ParlayRequest(sport=sport, style=style, legs=real_legs)
+    # Query(...) already validated sport/style/legs and the legs are ours,
+    # so bypass a second validation pass on the trampoline model.
+    req = ParlayRequest.model_construct(sport=sport, style=style, legs=real_legs)
     return build_parlay_response(req, using_real_odds=True)